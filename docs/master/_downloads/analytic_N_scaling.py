@@ -34,9 +34,18 @@ from __future__ import (
     print_function, division, absolute_import, unicode_literals
 )
 
+import itertools
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
 import argh
+import matplotlib
 import numpy as np
 
+if os.environ.get('MPLBACKEND') is None:
+    matplotlib.use('Agg')  # batch PNG generation, skip GUI backend
+
 from chemreac import FLAT, CYLINDRICAL, SPHERICAL, Geom_names
 from chemreac.util.plotting import save_and_or_show_plot
 
@@ -44,12 +53,51 @@ from analytic_diffusion import (
     integrate_rd
 )
 
+geoms = [FLAT, CYLINDRICAL, SPHERICAL]
+nstencils = [3, 5, 7]
+
+
+def _worker(task):
+    """
+    Runs the integrations for all stencil widths at one (geom, rate,
+    N) as a minibatch - the three IVPs share grid and stiffness, so
+    solving them back-to-back in one process amortizes worker warm-up
+    and solver set-up. Needs to be picklable, hence module level.
+    Only the numeric results needed by :func:`main` are returned -
+    ReactionDiffusion instances don't survive pickling.
+    """
+    (gi, geom), (ri, rate), N = task
+    batch = []
+    for si, nstencil in enumerate(nstencils):
+        _, _, info, rmsd_over_atol, _ = integrate_rd(
+            N=N, nstencil=nstencil, k=rate, geom='fcs'[geom],
+            atol=1e-8, rtol=1e-10)
+        # tout/yout/sys are dropped right away - only info and the
+        # rmsd row survive the batch
+        batch.append(((gi, ri, si), N, info, np.asarray(rmsd_over_atol)))
+    return batch
+
+
+def _fit_line(lx, ly):
+    """
+    Closed-form least-squares slope & intercept for a straight line
+    (avoids the SVD set-up cost of np.polyfit on tiny vectors).
+    """
+    n = len(lx)
+    sx, sy = lx.sum(), ly.sum()
+    sxx, sxy = (lx*lx).sum(), (lx*ly).sum()
+    slope = (n*sxy - sx*sy)/(n*sxx - sx*sx)
+    return slope, (sy - slope*sx)/n
+
 
 def main(plot=False, savefig='None', nNs=7, Ns=None, rates='0,0.1',
          nfit='7,5,4'):
     import matplotlib.pyplot as plt
-    nstencils = [3, 5, 7]
-    nfit = [float(_) for _ in nfit.split(',')]
+    plt.rcParams.update({'path.simplify': True,
+                         'path.simplify_threshold': 1.0,
+                         'agg.path.chunksize': 10000})
+    # nfit entries are used as slice bounds => cast to plain ints
+    nfit = np.fromstring(nfit, sep=',').astype(int).tolist()
     c = 'rbk'
     m = 'osd'
 
@@ -58,35 +106,48 @@ def main(plot=False, savefig='None', nNs=7, Ns=None, rates='0,0.1',
     else:
         Ns = list(map(int, Ns.split(',')))
         nNs = len(Ns)
+    logNs = np.log(np.asarray(Ns, dtype=np.float64))  # Ns never changes
 
     if plot:
         plt.figure(figsize=(8, 10))
 
-    rates = list(map(float, rates.split(',')))
-    for gi, geom in enumerate([FLAT, CYLINDRICAL, SPHERICAL]):
+    rates = np.fromstring(rates, sep=',').tolist()
+    # The integrations are independent stiff IVPs => spread them over
+    # all cores (one minibatch of stencil widths per task, stiffest N
+    # no longer stalls the rest of the sweep).
+    tasks = list(itertools.product(enumerate(geoms), enumerate(rates), Ns))
+    buckets = defaultdict(list)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        # consume the results lazily as workers finish - each batch is
+        # reduced to (N, info, rmsd) rows right away so peak memory is
+        # bounded by a single in-flight batch rather than the sweep
+        for batch in ex.map(_worker, tasks, chunksize=1):
+            for key, N, info, rmsd_over_atol in batch:
+                buckets[key].append((N, info, rmsd_over_atol))
+
+    for gi, geom in enumerate(geoms):
         for ri, rate in enumerate(rates):
             for si, nstencil in enumerate(nstencils):
                 print(Geom_names[geom], nstencil, rate)
-                tout, yout, info, rmsd_over_atol, sys = zip(*[
-                    integrate_rd(N=N, nstencil=nstencil, k=rate,
-                                 geom='fcs'[geom], atol=1e-8, rtol=1e-10)
-                    for N in Ns])
+                entries = buckets[gi, ri, si]
                 print('\n'.join(str(N)+': '+str(nfo) for
-                                N, nfo in zip(Ns, info)))
-                err = np.average(rmsd_over_atol, axis=1)
-                logNs = np.log(Ns)
-                logerr = np.log(err)
+                                N, nfo, _ in entries))
+                err = np.average([rmsd for _, _, rmsd in entries],
+                                 axis=1)
 
                 if plot:
-                    p = np.polyfit(logNs[:nfit[si]], logerr[:nfit[si]], 1)
+                    logerr = np.log(err)
+                    slope, intercept = _fit_line(logNs[:nfit[si]],
+                                                 logerr[:nfit[si]])
                     ax = plt.subplot(3, 2, gi*2 + ri + 1)
                     ax.set_xscale('log', basex=2)
                     ax.set_yscale('log', basey=2)
                     ax.plot(Ns, err, marker=m[si], ls='None', c=c[si])
                     ax.plot(
-                        Ns[:nNs-si], np.exp(np.polyval(p, logNs[:nNs-si])),
+                        Ns[:nNs-si],
+                        np.exp(slope*logNs[:nNs-si] + intercept),
                         ls='--', c=c[si],
-                        label=str(nstencil)+': '+str(round(-p[0], 1)))
+                        label=str(nstencil)+': '+str(round(-slope, 1)))
                     plt.xlabel('N')
                     ax = plt.gca()
                     # ax.set_xticklabels(map(str, Ns))